@@ -5,17 +5,18 @@ from flask import Flask, jsonify
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
 
-# Configure logging
+# Configure logging (LOG_LEVEL=INFO in production skips the verbose debug payloads).
+# The requests/urllib3 loggers inherit this level, so their connection chatter follows it too.
+log_level_name = os.environ.get("LOG_LEVEL", "DEBUG").upper()
+log_level = logging.getLevelNamesMapping().get(log_level_name)
 logging.basicConfig(
-    level=logging.DEBUG,
+    level=log_level if log_level is not None else logging.DEBUG,
     format='%(asctime)s [%(levelname)s] %(name)s: %(message)s',
     datefmt='%Y-%m-%d %H:%M:%S'
 )
 logger = logging.getLogger(__name__)
-
-# For testing the OCR feature, make requests module more verbose
-logging.getLogger('requests').setLevel(logging.DEBUG)
-logging.getLogger('urllib3').setLevel(logging.DEBUG)
+if log_level is None:
+    logger.warning(f"Unknown LOG_LEVEL '{log_level_name}', falling back to DEBUG")
 
 class Base(DeclarativeBase):
     pass
@@ -39,6 +40,10 @@ app.config["MAX_CONTENT_LENGTH"] = 16 * 1024 * 1024  # 16MB max upload size
 app.config["UPLOAD_FOLDER"] = "uploads"
 app.config["ALLOWED_EXTENSIONS"] = {"pdf", "png", "jpg", "jpeg"}
 
+# Embed the pre-normalization data in each normalized invoice (debugging aid only;
+# the raw LlamaCloud payload is always stored separately as raw_extraction_data)
+app.config["KEEP_RAW_RESPONSE"] = os.environ.get("KEEP_RAW_RESPONSE", "").lower() in ("1", "true", "yes")
+
 # Initialize the app with the extension
 db.init_app(app)
 
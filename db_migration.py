@@ -12,6 +12,7 @@ def run_migration():
     1. Add new columns to invoice_line_item table
     2. Create vendor_mapping table
     3. Add vendor_mapping_id column to invoice table
+    4. Index lower(vendor_name) for case-insensitive vendor lookups
     """
     # Get database connection info from environment variables
     db_url = os.environ.get('DATABASE_URL')
@@ -83,6 +84,13 @@ def run_migration():
             ALTER TABLE invoice ADD COLUMN IF NOT EXISTS vendor_mapping_id INTEGER REFERENCES vendor_mapping(id)
             """)
         
+        # Part 4: Functional index for case-insensitive vendor name lookups
+        cursor.execute("""
+        CREATE INDEX IF NOT EXISTS ix_vendor_mapping_name_lower
+        ON vendor_mapping (lower(vendor_name)) WHERE is_active
+        """)
+        logger.info("Created ix_vendor_mapping_name_lower index if it didn't exist")
+        
         # Commit changes and close connection
         conn.commit()
         conn.close()
@@ -11,6 +11,16 @@ class VendorMapping(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
     updated_at = db.Column(db.DateTime, onupdate=datetime.datetime.utcnow)
     
+    # Functional index for case-insensitive lookups of active mappings
+    __table_args__ = (
+        db.Index(
+            'ix_vendor_mapping_name_lower',
+            db.func.lower(vendor_name),
+            postgresql_where=db.text('is_active'),
+            sqlite_where=db.text('is_active')
+        ),
+    )
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -17,6 +17,17 @@ from utils import allowed_file, parse_invoice, get_vendor_mapping
 
 logger = logging.getLogger(__name__)
 
+class _LazyJson:
+    """Defers pretty-printing a payload until a log handler formats the record"""
+
+    __slots__ = ('obj',)
+
+    def __init__(self, obj):
+        self.obj = obj
+
+    def __str__(self):
+        return json.dumps(self.obj, indent=2)
+
 @app.route('/')
 def index():
     """Render the main application page"""
@@ -74,11 +85,6 @@ def upload_invoice():
             # Update invoice with parsed data
             invoice_data = parse_result['data']
             
-            # Add detailed logging of parsed data
-            logger.debug(f"Vendor name resolved: {invoice_data.get('vendor_name')}")
-            logger.debug(f"Mapped fields: {list(invoice_data.keys())}")
-            logger.debug(f"Line items: {invoice_data.get('line_items')}")
-            
             # Get raw extraction data
             raw_data = {}
             data_source_type = "extraction"
@@ -91,21 +97,22 @@ def upload_invoice():
             if not raw_data:
                 # No raw data found
                 logger.warning(f"No raw data found in parse result for invoice {invoice.id}")
-                logger.debug(f"Complete parse_result keys: {list(parse_result.keys())}")
-                logger.debug(f"Parse result success: {parse_result.get('success')}")
-            else:
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(f"Complete parse_result keys: {list(parse_result.keys())}")
+                    logger.debug(f"Parse result success: {parse_result.get('success')}")
+            elif logger.isEnabledFor(logging.DEBUG):
+                # Per-key inspection is skipped entirely unless DEBUG records are emitted
                 try:
                     logger.debug(f"Raw data type: {type(raw_data)}")
                     if isinstance(raw_data, dict):
                         logger.debug(f"Raw data keys: {list(raw_data.keys())}")
-                        for key in raw_data.keys():
-                            value = raw_data[key]
+                        for key, value in raw_data.items():
                             logger.debug(f"Raw data[{key}] type: {type(value)}")
                 except Exception as e:
                     logger.error(f"Error inspecting raw data: {str(e)}")
             
-            # Log the normalized data for comparison
-            logger.debug(f"OCR success for invoice {invoice.id}. Normalized data: {json.dumps(invoice_data, indent=2)}")
+            # Log the normalized data for comparison (serialized only if the record is emitted)
+            logger.debug("OCR success for invoice %s. Normalized data: %s", invoice.id, _LazyJson(invoice_data))
             
             vendor_name = invoice_data.get('vendor_name')
             invoice.vendor_name = vendor_name
@@ -113,22 +120,12 @@ def upload_invoice():
             
             # Try to find and associate a vendor mapping if available
             if vendor_name:
-                # Try exact match first
+                # Case-insensitive match, served by the lower(vendor_name) index;
+                # an exact-case match still wins over case variants
                 vendor_mapping = VendorMapping.query.filter(
-                    VendorMapping.vendor_name == vendor_name,
+                    db.func.lower(VendorMapping.vendor_name) == vendor_name.lower(),
                     VendorMapping.is_active == True
-                ).first()
-                
-                # If no exact match, try case-insensitive match
-                if not vendor_mapping:
-                    vendor_mappings = VendorMapping.query.filter(
-                        VendorMapping.is_active == True
-                    ).all()
-                    
-                    for mapping in vendor_mappings:
-                        if mapping.vendor_name.lower() == vendor_name.lower():
-                            vendor_mapping = mapping
-                            break
+                ).order_by((VendorMapping.vendor_name == vendor_name).desc()).first()
                 
                 if vendor_mapping:
                     invoice.vendor_mapping_id = vendor_mapping.id
@@ -315,13 +312,15 @@ def get_invoice(invoice_id):
         try:
             logger.debug(f"Parsing stored JSON data for invoice {invoice_id}: {invoice.parsed_data[:100]}...")
             stored_data = json.loads(invoice.parsed_data)
-            logger.debug(f"JSON parsed successfully. Structure: {list(stored_data.keys()) if isinstance(stored_data, dict) else 'Not a dict'}")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"JSON parsed successfully. Structure: {list(stored_data.keys()) if isinstance(stored_data, dict) else 'Not a dict'}")
             
             if isinstance(stored_data, dict):
                 # Check if data is in the newer formats
                 if 'normalized' in stored_data:
                     parsed_data = stored_data.get('normalized', {})
-                    logger.debug(f"Found normalized data structure. Keys: {list(parsed_data.keys()) if isinstance(parsed_data, dict) else 'Not a dict'}")
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug(f"Found normalized data structure. Keys: {list(parsed_data.keys()) if isinstance(parsed_data, dict) else 'Not a dict'}")
                     
                     # Get raw extraction data if present
                     if 'raw_extraction_data' in stored_data:
@@ -337,8 +336,9 @@ def get_invoice(invoice_id):
             logger.error(f"Invalid JSON data stored for invoice {invoice_id}: {str(e)}")
     
     # Always include raw data by default
+    invoice_dict = invoice.to_dict()
     response_data = {
-        'invoice': invoice.to_dict(),
+        'invoice': invoice_dict,
         'line_items': line_items,
         'parsed_data': parsed_data,  # Include the normalized parsed data
         'raw_extraction_data': raw_data,  # Always include raw extraction data
@@ -346,8 +346,9 @@ def get_invoice(invoice_id):
     }
     
     # Debug the response data structure
-    logger.debug(f"Response data keys: {list(response_data.keys())}")
-    logger.debug(f"Raw extraction data type: {type(raw_data)}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"Response data keys: {list(response_data.keys())}")
+        logger.debug(f"Raw extraction data type: {type(raw_data)}")
     
     # Make sure we always have something in raw_extraction_data, even if it's empty
     if not raw_data or (isinstance(raw_data, dict) and len(raw_data) == 0):
@@ -355,9 +356,9 @@ def get_invoice(invoice_id):
         
         # Use the full invoice object as a fallback if nothing else is available
         try:
-            # Convert the invoice to a dictionary including all fields
+            # Reuse the invoice dictionary built for the response
             full_invoice_data = {
-                'invoice': invoice.to_dict(),
+                'invoice': invoice_dict,
                 'status': 'API_SUCCESS_BUT_EMPTY_DATA',
                 'message': 'The API processed the document successfully but returned empty extraction data',
                 'metadata': {
@@ -688,7 +689,7 @@ def apply_vendor_mapping_to_invoice(invoice_id, mapping_id):
                     }), 400
                 
                 # Prepare data for normalization
-                from utils import transform_llama_cloud_to_invoice_format, normalize_invoice
+                from utils import transform_llama_cloud_to_invoice_format, normalize_invoice, parse_vendor_mapping
                 
                 # Process data with LlamaCloud - Transform the extraction data
                 transformed_data = transform_llama_cloud_to_invoice_format(raw_extraction_data, invoice.file_name)
@@ -697,8 +698,9 @@ def apply_vendor_mapping_to_invoice(invoice_id, mapping_id):
                 if transformed_data and isinstance(transformed_data, dict) and 'vendor' in transformed_data:
                     transformed_data['vendor']['name'] = mapping.vendor_name
                 
-                # Normalize the transformed data with the new mapping
-                normalized_data = normalize_invoice(transformed_data)
+                # Normalize with the row loaded above; the per-process mapping cache
+                # can lag behind edits committed by another worker
+                normalized_data = normalize_invoice(transformed_data, mapping=parse_vendor_mapping(mapping))
                 
                 # Update invoice with newly normalized data
                 if normalized_data:
@@ -65,6 +65,10 @@ def test_llama_cloud_api():
         # Track time for informational purposes
         start_time = time.time()
         
+        # One session for upload, polling and result download so every call after
+        # the first reuses the same TLS connection (requests already asks for gzip)
+        session = requests.Session()
+        
         # Step 1: Upload file to LlamaCloud
         print("Step 1: Uploading file...")
         
@@ -87,7 +91,7 @@ def test_llama_cloud_api():
         }
         
         # Send upload request with files parameter for multipart/form-data
-        upload_response = requests.post(
+        upload_response = session.post(
             upload_url,
             headers=headers,
             files=files
@@ -122,7 +126,7 @@ def test_llama_cloud_api():
         
         while retry_count < max_retries:
             # Get job status
-            status_response = requests.get(status_url, headers=headers)
+            status_response = session.get(status_url, headers=headers)
             
             if status_response.status_code != 200:
                 print(f"Error checking job status: {status_response.status_code}")
@@ -162,7 +166,7 @@ def test_llama_cloud_api():
         
         # Also, let's try to add a detailed flag to get more information
         result_params = {"detailed": "true"}
-        result_response = requests.get(result_url, headers=headers, params=result_params)
+        result_response = session.get(result_url, headers=headers, params=result_params)
         
         if result_response.status_code != 200:
             print(f"Error retrieving results: {result_response.status_code}")
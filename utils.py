@@ -1,15 +1,266 @@
 import os
+import io
 import json
 import logging
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib3.fields import RequestField
+from urllib3.filepost import choose_boundary
 import re
 import time
+import random
+import functools
+import itertools
+from typing import Any, List, Optional, TypedDict
 from app import app
 
 logger = logging.getLogger(__name__)
 
 API_REQUEST_TIMEOUT = 30
 MAX_POLLING_TIMEOUT = 25
+VENDOR_MAPPING_CACHE_TTL = 300  # seconds
+POLL_INITIAL_DELAY = 0.2  # seconds
+POLL_MAX_DELAY = 2.0  # seconds
+POLL_BACKOFF_FACTOR = 1.5
+HTTP_MAX_RETRIES = 4
+RETRY_BACKOFF_BASE = 0.5  # seconds
+RETRY_BACKOFF_CAP = 10.0  # seconds
+UPLOAD_RETRY_TIMEOUT = 15  # seconds an upload may spend waiting between retries
+
+# Shared session so uploads and status polls reuse pooled keep-alive connections.
+# urllib3 only retries connection failures here; retryable HTTP statuses go through
+# _send_with_retry, which caps Retry-After waits and respects the polling deadline.
+_session = requests.Session()
+_session.mount("https://", HTTPAdapter(
+    pool_connections=10,
+    pool_maxsize=20,
+    max_retries=Retry(total=3, backoff_factor=0.3, respect_retry_after_header=False)
+))
+
+# Statuses worth retrying. An upload is only replayed when the server says it was
+# not accepted, so a 5xx after the job was created cannot start a duplicate parse.
+_RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+_UPLOAD_RETRY_STATUSES = frozenset({429, 503})
+
+# Lower-cased LlamaCloud job states that end polling
+_DONE_STATES = frozenset({'complete', 'success'})
+_ERROR_STATES = frozenset({'error', 'failed'})
+
+# Precompiled patterns used on every invoice
+_UUID_RE = re.compile(r'^[0-9a-f-]{36}$', re.IGNORECASE)
+# Deletes every character str.isspace() (and regex \s) treats as whitespace;
+# the highest such code point is U+3000
+_WHITESPACE_DELETE_TABLE = dict.fromkeys(i for i in range(0x3001) if chr(i).isspace())
+_PROJECT_NUMBER_FALLBACK_RES = (
+    re.compile(r'(?:PN|Project No)[\s:=]*([A-Z0-9\-]+)'),
+    re.compile(r'(?:Project|Job)[\s:=]*#?\s*([A-Z0-9\-]+)'),
+    re.compile(r'#\s*([A-Z0-9\-]{5,})'),
+)
+_CONTRACTOR_NAME_RE = re.compile(r"Contractor Name\s+([A-Za-z\s]+)")
+_RATE_QTY_RE = re.compile(r"\(?\$?([\d.,]+)\s*x\s*([\d.,]+)")
+
+# Allowed upload extensions, lower-cased once; app.py sets the config before this import
+_ALLOWED_EXTENSIONS = frozenset(ext.lower() for ext in app.config['ALLOWED_EXTENSIONS'])
+
+# MIME type expected for each allowed upload extension
+_EXTENSION_MIME_TYPES = {
+    'pdf': 'application/pdf',
+    'jpg': 'image/jpeg',
+    'jpeg': 'image/jpeg',
+    'png': 'image/png'
+}
+
+# Candidate locations of each field in a LlamaCloud extraction, in priority order
+_EXTRACTION_ROOT_KEYS = ('data', 'document', 'invoice', 'results', 'content', 'extraction')
+_VENDOR_NAME_PATHS = (('vendor', 'name'), ('vendor_name',), ('supplier_name',), ('company_name',))
+_INVOICE_NUMBER_PATHS = (('invoice_number',), ('invoiceNumber',), ('id',), ('number',))
+_INVOICE_DATE_PATHS = (('invoice_date',), ('date',), ('issue_date',))
+_DUE_DATE_PATHS = (('due_date',), ('payment_due',))
+_TOTAL_AMOUNT_PATHS = (('total_amount',), ('total',), ('grand_total',))
+_LINE_ITEM_PATHS = (('line_items',), ('items',), ('details',))
+
+# Top-level extraction key -> (target field, priority, remaining nested path)
+_KEY_ROUTER = {
+    path[0]: (target, priority, path[1:])
+    for target, paths in (
+        ('vendor_name', _VENDOR_NAME_PATHS),
+        ('invoice_number', _INVOICE_NUMBER_PATHS),
+        ('invoice_date', _INVOICE_DATE_PATHS),
+        ('due_date', _DUE_DATE_PATHS),
+        ('total_amount', _TOTAL_AMOUNT_PATHS),
+        ('line_items', _LINE_ITEM_PATHS),
+    )
+    for priority, path in enumerate(paths)
+}
+
+class NormalizedLineItem(TypedDict):
+    """Shape of a line item produced by normalize_invoice"""
+    description: str
+    project_number: str
+    project_name: str
+    activity_code: str
+    quantity: float
+    unit_price: float
+    amount: float
+    tax: float
+
+class NormalizedInvoice(TypedDict, total=False):
+    """Shape of the invoice dict produced by normalize_invoice"""
+    vendor_name: Optional[str]
+    invoice_number: Optional[str]
+    invoice_date: Optional[str]
+    due_date: Optional[str]
+    total_amount: float
+    line_items: List[NormalizedLineItem]
+    raw_response: Any
+
+# Defaults for every normalized line item (copied per item)
+_LINE_ITEM_TEMPLATE: NormalizedLineItem = {
+    'description': '', 'project_number': '', 'project_name': '',
+    'activity_code': '', 'quantity': 1.0, 'unit_price': 0.0,
+    'amount': 0.0, 'tax': 0.0
+}
+_NUMERIC_ITEM_FIELDS = ('quantity', 'unit_price', 'amount', 'tax')
+
+# Header defaults for every normalized invoice; line_items is replaced per copy
+_INVOICE_TEMPLATE = {
+    'invoice_number': None, 'invoice_date': None, 'due_date': None,
+    'total_amount': 0.0, 'line_items': ()
+}
+
+# Fallback mapping used when a vendor has no custom mapping.
+# Shared across calls, so callers must treat it as read-only.
+_DEFAULT_MAPPING = {
+    'field_mappings': {
+        'invoice_number': ['invoice_number', 'invoice #', 'bill #'],
+        'invoice_date': ['invoice_date', 'date'],
+        'due_date': ['due_date'],
+        'total_amount': ['total_amount', 'total'],
+        'line_items': {
+            'description': ['description', 'item'],
+            'project_number': ['project_number'],
+            'project_name': ['project_name'],
+            'activity_code': ['activity_code'],
+            'quantity': ['quantity'],
+            'unit_price': ['unit_price'],
+            'amount': ['amount'],
+            'tax': ['tax']
+        }
+    },
+    'regex_patterns': {
+        'project_number': r'(?:PN|Project)\s*[:=]?\s*([A-Z0-9\-]+)',
+        'activity_code': r'(?:Activity|Task)\s*(?:Code)?\s*[:=]?\s*([A-Z0-9\-]+)'
+    }
+}
+
+def _field_paths(field_mappings):
+    """
+    Pre-split the header field sources of a mapping into key tuples
+    
+    Args:
+        field_mappings: Mapping of target field to list of source names,
+                        where dot notation addresses nested fields
+        
+    Returns:
+        dict: Target field to tuple of key paths, in priority order
+    """
+    return {
+        target: tuple(tuple(src.split('.')) for src in sources)
+        for target, sources in field_mappings.items()
+        if target != 'line_items'
+    }
+
+def _item_source_pairs(field_mappings):
+    """
+    Flatten the line item sources of a mapping into (source, target) pairs
+    
+    Sources are listed lowest priority first, so assigning every pair whose
+    source is present leaves each target with its highest-priority value.
+    
+    Args:
+        field_mappings: Mapping whose 'line_items' entry maps target field
+                        to list of source names
+        
+    Returns:
+        tuple: (source, target) pairs in assignment order
+    """
+    return tuple(
+        (src, target)
+        for target, sources in field_mappings.get('line_items', {}).items()
+        for src in reversed(sources)
+    )
+
+def _walk(data, path):
+    """
+    Follow a tuple of keys into nested dicts
+    
+    Args:
+        data: Dict to start from
+        path: Tuple of keys
+        
+    Returns:
+        The value at the end of the path, or None if any key is missing
+    """
+    try:
+        for part in path:
+            data = data[part]
+    except (KeyError, TypeError):
+        # Missing key, or an intermediate value that is not a dict
+        return None
+    return data
+
+_DEFAULT_MAPPING['field_paths'] = _field_paths(_DEFAULT_MAPPING['field_mappings'])
+_DEFAULT_MAPPING['item_source_pairs'] = _item_source_pairs(_DEFAULT_MAPPING['field_mappings'])
+_DEFAULT_MAPPING['compiled_patterns'] = {
+    field: re.compile(pattern) for field, pattern in _DEFAULT_MAPPING['regex_patterns'].items()
+}
+
+@functools.lru_cache(maxsize=256)
+def _compiled(pattern):
+    """
+    Compile a regex pattern once and reuse it across calls
+    
+    Args:
+        pattern: Regex pattern string
+        
+    Returns:
+        re.Pattern: Compiled pattern
+    """
+    return re.compile(pattern)
+
+def _parse_amount(value):
+    """
+    Convert a currency amount such as "$1,234.50" to a float
+    
+    Args:
+        value: Amount as a number or string
+        
+    Returns:
+        float: Parsed amount, or 0.0 if empty or not numeric
+    """
+    # Structured extractions usually carry plain numbers; bools take the string path
+    if type(value) in (float, int):
+        return float(value)
+    if not value:
+        return 0.0
+    try:
+        return float(str(value).replace('$', '').replace(',', ''))
+    except ValueError:
+        return 0.0
+
+def _coerce_numeric_fields(item):
+    """
+    Convert the numeric fields of a line item to floats in place
+    
+    Args:
+        item: Line item dict; empty or invalid values become 0.0
+    """
+    for field in _NUMERIC_ITEM_FIELDS:
+        try:
+            item[field] = float(item[field] or 0)
+        except (TypeError, ValueError):
+            item[field] = 0.0
 
 def clean_id(id_value):
     """
@@ -24,11 +275,14 @@ def clean_id(id_value):
     if isinstance(id_value, bytes):
         id_value = id_value.decode('utf-8', errors='ignore')
     cleaned_id = str(id_value).strip()
-    cleaned_id = re.sub(r'\s+', '', cleaned_id)
-    if re.match(r'^[0-9a-f-]{36}$', cleaned_id, re.IGNORECASE):
+    cleaned_id = cleaned_id.translate(_WHITESPACE_DELETE_TABLE)
+    if len(cleaned_id) != 36 or cleaned_id[8] == cleaned_id[13] == cleaned_id[18] == cleaned_id[23] == '-':
+        # Non-UUIDs need no rebuild, and with the dashes already in place the
+        # rebuild would reproduce the input (the common, well-formed case)
+        return cleaned_id
+    if cleaned_id.count('-') == 4 and _UUID_RE.match(cleaned_id):
         uuid_parts = cleaned_id.replace('-', '')
-        if len(uuid_parts) == 32:
-            cleaned_id = f"{uuid_parts[0:8]}-{uuid_parts[8:12]}-{uuid_parts[12:16]}-{uuid_parts[16:20]}-{uuid_parts[20:32]}"
+        cleaned_id = f"{uuid_parts[0:8]}-{uuid_parts[8:12]}-{uuid_parts[12:16]}-{uuid_parts[16:20]}-{uuid_parts[20:32]}"
     return cleaned_id
 
 def allowed_file(filename, mime_type=None):
@@ -42,17 +296,12 @@ def allowed_file(filename, mime_type=None):
     Returns:
         bool: True if file is allowed, False otherwise
     """
-    if not ('.' in filename and filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']):
+    _, dot, extension = filename.rpartition('.')
+    extension = extension.lower()
+    if not dot or extension not in _ALLOWED_EXTENSIONS:
+        return False
+    if mime_type and _EXTENSION_MIME_TYPES.get(extension) != mime_type:
         return False
-    if mime_type:
-        allowed_mime_types = {
-            'application/pdf': ['pdf'],
-            'image/jpeg': ['jpg', 'jpeg'],
-            'image/png': ['png']
-        }
-        extension = filename.rsplit('.', 1)[1].lower()
-        if mime_type not in allowed_mime_types or extension not in allowed_mime_types[mime_type]:
-            return False
     return True
 
 def extract_from_desc(description, pattern):
@@ -61,72 +310,194 @@ def extract_from_desc(description, pattern):
     
     Args:
         description: Text to search in
-        pattern: Regex pattern to use for extraction
+        pattern: Regex pattern (string or compiled) to use for extraction
         
     Returns:
         str: Extracted value or None
     """
     if not description:
         return None
-    match = re.search(pattern, description)
+    if isinstance(pattern, str):
+        pattern = _compiled(pattern)
+    match = pattern.search(description)
     return match.group(1) if match else None
 
-def get_vendor_mapping(vendor_name, session=None):
+def _lookup_vendor_mapping(vendor_name, session):
     """
-    Get vendor-specific field mappings from the database
+    Query the active vendor mapping matching a vendor name case-insensitively
+    
+    An exact-case match wins over rows that differ only in case.
     
     Args:
         vendor_name: The name of the vendor to look up
-        session: Optional database session
+        session: Database session to query with
         
     Returns:
-        dict: Vendor field mappings or default mappings if not found
+        dict: Parsed vendor field mappings or default mappings if not found
     """
-    from app import db
+    from sqlalchemy import func
     from models import VendorMapping
 
-    default = {
-        'field_mappings': {
-            'invoice_number': ['invoice_number', 'invoice #', 'bill #'],
-            'invoice_date': ['invoice_date', 'date'],
-            'due_date': ['due_date'],
-            'total_amount': ['total_amount', 'total'],
-            'line_items': {
-                'description': ['description', 'item'],
-                'project_number': ['project_number'],
-                'project_name': ['project_name'],
-                'activity_code': ['activity_code'],
-                'quantity': ['quantity'],
-                'unit_price': ['unit_price'],
-                'amount': ['amount'],
-                'tax': ['tax']
-            }
-        },
-        'regex_patterns': {
-            'project_number': r'(?:PN|Project)\s*[:=]?\s*([A-Z0-9\-]+)',
-            'activity_code': r'(?:Activity|Task)\s*(?:Code)?\s*[:=]?\s*([A-Z0-9\-]+)'
-        }
-    }
+    vm = session.query(VendorMapping).filter(
+        func.lower(VendorMapping.vendor_name) == vendor_name.lower(),
+        VendorMapping.is_active == True
+    ).order_by((VendorMapping.vendor_name == vendor_name).desc()).first()
+
+    return parse_vendor_mapping(vm) if vm else _DEFAULT_MAPPING
 
+def parse_vendor_mapping(vm):
+    """
+    Build the normalization mapping for a loaded VendorMapping row
+    
+    Args:
+        vm: VendorMapping row
+        
+    Returns:
+        dict: Parsed vendor field mappings or default mappings if the row has none
+    """
+    if not vm.field_mappings:
+        return _DEFAULT_MAPPING
+    return _parse_mapping_json(vm.id, vm.updated_at, vm.field_mappings, vm.regex_patterns)
+
+@functools.lru_cache(maxsize=256)
+def _parse_mapping_json(row_id, updated_at, field_mappings, regex_patterns):
+    """
+    Parse a vendor mapping's JSON columns, cached per row version.
+    The raw strings are part of the key, so a row edited without an
+    updated_at bump is still re-parsed.
+    """
+    parsed_field_mappings = json.loads(field_mappings)
+    parsed_regex_patterns = json.loads(regex_patterns) if regex_patterns else {}
     try:
-        if session is None:
-            session = db.session
+        compiled_patterns = {field: _compiled(pattern) for field, pattern in parsed_regex_patterns.items()}
+    except (re.error, TypeError):
+        # normalize_invoice compiles lazily then, so a bad pattern only fails the
+        # invoices it is applied to, as it did before patterns were precompiled
+        compiled_patterns = None
+    return {
+        'field_mappings': parsed_field_mappings,
+        'field_paths': _field_paths(parsed_field_mappings),
+        'item_source_pairs': _item_source_pairs(parsed_field_mappings),
+        'regex_patterns': parsed_regex_patterns,
+        'compiled_patterns': compiled_patterns
+    }
 
-        vm = session.query(VendorMapping).filter(
-            VendorMapping.vendor_name == vendor_name,
-            VendorMapping.is_active == True
-        ).first()
+class _VendorMappingMiss(Exception):
+    """Raised out of _cached_vendor_mapping so lru_cache does not store misses"""
 
-        if vm and vm.field_mappings:
-            return {
-                'field_mappings': json.loads(vm.field_mappings),
-                'regex_patterns': json.loads(vm.regex_patterns) if vm.regex_patterns else {}
-            }
+@functools.lru_cache(maxsize=512)
+def _cached_vendor_mapping(vendor_name, ttl_bucket):
+    """
+    Cached vendor mapping lookup on the application session.
+    ttl_bucket changes every VENDOR_MAPPING_CACHE_TTL seconds so entries
+    expire even in worker processes that never see an invalidation.
+    Misses raise instead of returning, so a mapping created in another
+    worker is picked up on the next lookup rather than after the TTL.
+    """
+    from app import db
+    mapping = _lookup_vendor_mapping(vendor_name, db.session)
+    if mapping is _DEFAULT_MAPPING:
+        raise _VendorMappingMiss(vendor_name)
+    return mapping
+
+def invalidate_vendor_mapping_cache():
+    """Drop all cached vendor mappings (called automatically when a VendorMapping change commits)"""
+    _cached_vendor_mapping.cache_clear()
+
+def _register_vendor_mapping_invalidation():
+    """
+    Clear the vendor mapping cache whenever a VendorMapping change is committed
+    
+    Flushes only flag the session; the cache is dropped in after_commit so a
+    concurrent lookup cannot re-cache the row as it was before the commit.
+    """
+    from sqlalchemy import event
+    from sqlalchemy.orm import Session
+    from models import VendorMapping
+
+    @event.listens_for(Session, 'after_flush')
+    def flag_vendor_mapping_changes(session, flush_context):
+        for obj in itertools.chain(session.new, session.dirty, session.deleted):
+            if isinstance(obj, VendorMapping):
+                session.info['vendor_mapping_changed'] = True
+                return
+
+    @event.listens_for(Session, 'after_commit')
+    def clear_vendor_mapping_cache(session):
+        if session.info.pop('vendor_mapping_changed', False):
+            invalidate_vendor_mapping_cache()
 
-        return default
+    @event.listens_for(Session, 'after_rollback')
+    def forget_vendor_mapping_changes(session):
+        session.info.pop('vendor_mapping_changed', None)
+
+_register_vendor_mapping_invalidation()
+
+def get_vendor_mapping(vendor_name, session=None):
+    """
+    Get vendor-specific field mappings from the database
+    
+    Vendor names are matched case-insensitively, preferring an exact-case
+    match. Found mappings are cached per vendor name unless an explicit
+    session is passed; the returned dict is shared and must not be mutated.
+    Other worker processes only see an edit once their cache entry expires
+    (VENDOR_MAPPING_CACHE_TTL), so code acting right after an edit should
+    parse the row it holds with parse_vendor_mapping instead.
+    
+    Args:
+        vendor_name: The name of the vendor to look up
+        session: Optional database session (bypasses the cache)
+        
+    Returns:
+        dict: Vendor field mappings or default mappings if not found
+    """
+    if not vendor_name:
+        return _DEFAULT_MAPPING
+
+    try:
+        if session is not None:
+            return _lookup_vendor_mapping(vendor_name, session)
+        ttl_bucket = int(time.monotonic() // VENDOR_MAPPING_CACHE_TTL)
+        return _cached_vendor_mapping(vendor_name, ttl_bucket)
+    except _VendorMappingMiss:
+        return _DEFAULT_MAPPING
     except Exception as e:
         logger.warning(f"Vendor mapping fallback due to error: {str(e)}")
-        return default
+        return _DEFAULT_MAPPING
+
+def _route_extraction_fields(invoice_data):
+    """
+    Collect invoice fields from LlamaCloud extraction data in a single pass
+    
+    Each top-level key is routed through _KEY_ROUTER. When several candidate
+    keys are present, the one listed first in the field's path tuple wins.
+    
+    Args:
+        invoice_data: Extraction data (the nested document, if any)
+        
+    Returns:
+        dict: Target field name to the highest-priority non-empty value
+    """
+    found = {}
+    if not isinstance(invoice_data, dict):
+        return {}
+
+    for key, value in invoice_data.items():
+        route = _KEY_ROUTER.get(key)
+        if route is None:
+            continue
+        target, priority, sub_path = route
+        if sub_path:
+            value = _walk(value, sub_path)
+        if value is None or value == "":
+            continue
+        # Line items only count when they are a non-empty list
+        if target == 'line_items' and not (value and isinstance(value, list)):
+            continue
+        if target not in found or priority < found[target][0]:
+            found[target] = (priority, value)
+
+    return {target: value for target, (_, value) in found.items()}
 
 def transform_llama_cloud_to_invoice_format(extraction_data, file_name):
     """
@@ -141,79 +512,36 @@ def transform_llama_cloud_to_invoice_format(extraction_data, file_name):
     """
     try:
         logger.debug(f"Transforming LlamaCloud data for: {file_name}")
-        logger.debug(f"Extraction data keys: {list(extraction_data.keys()) if isinstance(extraction_data, dict) else 'Not dict'}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Extraction data keys: {list(extraction_data.keys()) if isinstance(extraction_data, dict) else 'Not dict'}")
         if isinstance(extraction_data, dict):
-            for potential_key in ['data', 'document', 'results', 'content', 'extraction']:
-                if potential_key in extraction_data and isinstance(extraction_data[potential_key], dict):
-                    extraction_data = extraction_data[potential_key]
-                    break
+            nested = next((v for v in map(extraction_data.get, _EXTRACTION_ROOT_KEYS) if isinstance(v, dict)), None)
+            if nested is not None:
+                extraction_data = nested
 
-        invoice_data = extraction_data
-        transformed = {
-            'vendor_name': None,
-            'invoice_number': None,
-            'invoice_date': None,
-            'due_date': None,
-            'total_amount': 0.0,
-            'line_items': [],
-            'file_name': file_name
-        }
-
-        def find_field(paths):
-            for path in paths:
-                temp = invoice_data
-                for part in path:
-                    if isinstance(temp, dict) and part in temp:
-                        temp = temp[part]
-                    else:
-                        temp = None
-                        break
-                if temp not in [None, ""]:
-                    return temp
-            return None
-
-        transformed['vendor_name'] = find_field([
-            ('vendor', 'name'), ('vendor_name',), ('supplier_name',), ('company_name',)
-        ]) or "Unknown Vendor"
-        
-        # Force set vendor field for normalization stages
-        transformed['vendor'] = {'name': transformed['vendor_name']}
-
-        transformed['invoice_number'] = str(find_field([
-            ('invoice_number',), ('invoiceNumber',), ('id',), ('number',)
-        ]) or "")
-        
-        # Fallback to using filename if no invoice number found
-        if not transformed['invoice_number']:
-            transformed['invoice_number'] = os.path.splitext(file_name)[0]
+        fields = _route_extraction_fields(extraction_data)
+        vendor_name = fields.get('vendor_name') or "Unknown Vendor"
 
-        transformed['invoice_date'] = str(find_field([
-            ('invoice_date',), ('date',), ('issue_date',)
-        ]) or "")
-
-        transformed['due_date'] = str(find_field([
-            ('due_date',), ('payment_due',)
-        ]) or "")
-
-        amount = find_field([
-            ('total_amount',), ('total',), ('grand_total',)
-        ])
+        amount = fields.get('total_amount')
         if isinstance(amount, dict) and 'amount' in amount:
             amount = amount['amount']
-        try:
-            transformed['total_amount'] = float(str(amount).replace('$', '').replace(',', '')) if amount else 0.0
-        except:
-            transformed['total_amount'] = 0.0
-
-        # Extract line items
-        for line_path in [('line_items',), ('items',), ('details',)]:
-            items = find_field([line_path])
-            if items and isinstance(items, list):
-                for item in items:
-                    transformed['line_items'].append(item)
-                break
 
-        logger.debug(f"Transformed LlamaCloud data keys: {list(transformed.keys())}")
+        # Built in one go; normalize_invoice and vendor field mappings read these keys
+        transformed = {
+            'vendor_name': vendor_name,
+            # Fallback to using filename if no invoice number found
+            'invoice_number': str(fields.get('invoice_number') or "") or os.path.splitext(file_name)[0],
+            'invoice_date': str(fields.get('invoice_date') or ""),
+            'due_date': str(fields.get('due_date') or ""),
+            'total_amount': _parse_amount(amount),
+            'line_items': list(fields.get('line_items') or ()),
+            'file_name': file_name,
+            # Force set vendor field for normalization stages
+            'vendor': {'name': vendor_name}
+        }
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Transformed LlamaCloud data keys: {list(transformed.keys())}")
         return transformed
 
     except Exception as e:
@@ -229,108 +557,88 @@ def transform_llama_cloud_to_invoice_format(extraction_data, file_name):
             'error': str(e)
         }
 
-def normalize_invoice(invoice_data):
+def normalize_invoice(invoice_data, mapping=None, keep_raw=None) -> NormalizedInvoice:
     """
     Normalize invoice data from LlamaCloud response with vendor-specific mappings
     
     Args:
         invoice_data: Raw response data from LlamaCloud
+        mapping: Optional already-parsed vendor mapping; looked up by vendor
+                 name when omitted
+        keep_raw: Embed invoice_data as 'raw_response' in the result; defaults to
+                  the KEEP_RAW_RESPONSE config flag
         
     Returns:
         dict: Normalized invoice data with consistent fields
     """
-    def safe(v): return v if v is not None else None
-
-    vendor_name = safe(invoice_data.get('vendor_name'))
-    mapping = get_vendor_mapping(vendor_name)
+    vendor_name = invoice_data.get('vendor_name')
+    if mapping is None:
+        mapping = get_vendor_mapping(vendor_name)
     field_mappings = mapping['field_mappings']
-    regex_patterns = mapping['regex_patterns']
-
-    invoice = {
-        'vendor_name': vendor_name,
-        'invoice_number': None,
-        'invoice_date': None,
-        'due_date': None,
-        'total_amount': 0.0,
-        'line_items': [],
-        'raw_response': invoice_data
-    }
-
-    for target, sources in field_mappings.items():
-        if target == 'line_items':
-            continue
-        for src in sources:
-            # Handle nested field paths (dot notation)
-            if '.' in src:
-                parts = src.split('.')
-                temp = invoice_data
-                for part in parts:
-                    if isinstance(temp, dict) and part in temp:
-                        temp = temp[part]
-                    else:
-                        temp = None
-                        break
-                val = temp
-            else:
-                val = invoice_data.get(src)
-                
+    compiled_patterns = mapping.get('compiled_patterns')
+    if compiled_patterns is None:
+        # Some pattern did not compile; compile each one on first use instead so an
+        # invalid pattern only fails invoices that actually search a description
+        compiled_patterns = mapping['regex_patterns']
+
+    invoice: NormalizedInvoice = {'vendor_name': vendor_name, **_INVOICE_TEMPLATE, 'line_items': []}
+
+    field_paths = mapping.get('field_paths') or _field_paths(field_mappings)
+    for target, paths in field_paths.items():
+        for path in paths:
+            # Single keys are a plain lookup; dot notation was pre-split into nested paths
+            val = invoice_data.get(path[0]) if len(path) == 1 else _walk(invoice_data, path)
             if val:
                 invoice[target] = val
                 break
 
-    try:
-        amt = invoice.get('total_amount', 0)
-        invoice['total_amount'] = float(str(amt).replace('$', '').replace(',', '')) if amt else 0.0
-    except:
-        invoice['total_amount'] = 0.0
+    invoice['total_amount'] = _parse_amount(invoice.get('total_amount', 0))
 
-    item_map = field_mappings.get('line_items', {})
+    # One flat pass per item instead of a nested target/source scan
+    item_source_pairs = mapping.get('item_source_pairs')
+    if item_source_pairs is None:
+        item_source_pairs = _item_source_pairs(field_mappings)
     raw_items = invoice_data.get('line_items') or []
     if not isinstance(raw_items, list):
         raw_items = []
-        
+    line_items = invoice['line_items']
+
     for raw in raw_items:
-        item = {
-            'description': '', 'project_number': '', 'project_name': '',
-            'activity_code': '', 'quantity': 1.0, 'unit_price': 0.0,
-            'amount': 0.0, 'tax': 0.0
-        }
-        for tgt, src_list in item_map.items():
-            for src in src_list:
-                if src in raw:
-                    item[tgt] = raw[src]
-                    break
+        item = _LINE_ITEM_TEMPLATE.copy()
+        for src, tgt in item_source_pairs:
+            if src in raw:
+                item[tgt] = raw[src]
 
         desc = item.get('description') or ''
-        
-        # Apply standard regex patterns from mapping
-        for field, pattern in regex_patterns.items():
-            if not item.get(field) and desc:
-                match = extract_from_desc(desc, pattern)
-                if match:
-                    item[field] = match
-        
-        # Additional fallback patterns for common fields
-        if not item.get('project_number'):
-            fallback_patterns = [
-                r'(?:PN|Project No)[\s:=]*([A-Z0-9\-]+)',
-                r'(?:Project|Job)[\s:=]*#?\s*([A-Z0-9\-]+)',
-                r'#\s*([A-Z0-9\-]{5,})'
-            ]
-            for pattern in fallback_patterns:
-                match = extract_from_desc(desc, pattern)
-                if match:
-                    item['project_number'] = match
-                    logger.debug(f"Extracted project number using fallback pattern: {match}")
-                    break
-
-        for num_field in ['quantity', 'unit_price', 'amount', 'tax']:
-            try:
-                item[num_field] = float(item[num_field] or 0)
-            except:
-                item[num_field] = 0.0
-
-        invoice['line_items'].append(item)
+        if desc:
+            # Apply standard regex patterns from mapping
+            for field, pattern in compiled_patterns.items():
+                if not item.get(field):
+                    if not isinstance(pattern, re.Pattern):
+                        pattern = _compiled(pattern)
+                    found = pattern.search(desc)
+                    match = found.group(1) if found else None
+                    if match:
+                        item[field] = match
+
+            # Additional fallback patterns for common fields
+            if not item.get('project_number'):
+                for pattern in _PROJECT_NUMBER_FALLBACK_RES:
+                    found = pattern.search(desc)
+                    match = found.group(1) if found else None
+                    if match:
+                        item['project_number'] = match
+                        logger.debug(f"Extracted project number using fallback pattern: {match}")
+                        break
+
+        _coerce_numeric_fields(item)
+
+        line_items.append(item)
+
+    if keep_raw is None:
+        keep_raw = app.config.get('KEEP_RAW_RESPONSE')
+    if keep_raw:
+        invoice['raw_response'] = invoice_data
 
     return invoice
 
@@ -364,6 +672,101 @@ def parse_invoice(file_path):
             'parser_used': parser_used
         }
 
+def _retry_delay(response, attempt):
+    """
+    Return how long to wait before retrying a throttled or failed request
+    
+    Honors a numeric Retry-After header, otherwise backs off exponentially
+    with jitter so concurrent jobs do not retry in lockstep.
+    
+    Args:
+        response: The response that triggered the retry
+        attempt: Zero-based retry attempt number
+        
+    Returns:
+        float: Delay in seconds
+    """
+    retry_after = response.headers.get("Retry-After")
+    if retry_after:
+        try:
+            return min(RETRY_BACKOFF_CAP, max(0.0, float(retry_after)))
+        except ValueError:
+            pass  # HTTP-date form; fall back to exponential backoff
+    return min(RETRY_BACKOFF_CAP, RETRY_BACKOFF_BASE * (2 ** attempt)) + random.uniform(0, RETRY_BACKOFF_BASE)
+
+def _poll_delay(attempt):
+    """
+    Return how long to wait before the next job status poll
+    
+    Grows geometrically from POLL_INITIAL_DELAY up to POLL_MAX_DELAY, with
+    +/-20% jitter so concurrent jobs do not poll in lockstep.
+    
+    Args:
+        attempt: Zero-based poll attempt number
+        
+    Returns:
+        float: Delay in seconds
+    """
+    delay = min(POLL_MAX_DELAY, POLL_INITIAL_DELAY * (POLL_BACKOFF_FACTOR ** attempt))
+    return delay * random.uniform(0.8, 1.2)
+
+def _send_with_retry(send, retry_statuses, deadline=None):
+    """
+    Issue a request, retrying while the server answers with a retryable status
+    
+    Args:
+        send: Zero-argument callable that issues the request
+        retry_statuses: HTTP status codes worth retrying
+        deadline: Optional time.monotonic() value; no retry wait may run past it
+        
+    Returns:
+        The last response received
+    """
+    for attempt in range(HTTP_MAX_RETRIES):
+        response = send()
+        if response.status_code not in retry_statuses:
+            return response
+        delay = _retry_delay(response, attempt)
+        if deadline is not None and time.monotonic() + delay >= deadline:
+            return response
+        logger.warning(f"LlamaCloud returned {response.status_code}, retrying in {delay:.1f}s")
+        time.sleep(delay)
+    return send()
+
+class _MultipartFileBody:
+    """
+    File-like multipart/form-data body that streams a single file from disk
+    
+    requests renders files= uploads into one in-memory bytes object, so a large
+    scanned PDF would be copied whole before sending. Passing this object as
+    data= instead lets the adapter read it in blocks with a known length.
+    """
+
+    def __init__(self, field_name, file_name, fileobj, mime_type, size=None):
+        boundary = choose_boundary()
+        field = RequestField(name=field_name, data=b"", filename=file_name)
+        field.make_multipart(content_type=mime_type)
+        head = f"--{boundary}\r\n".encode("latin-1") + field.render_headers().encode("utf-8")
+        tail = f"\r\n--{boundary}--\r\n".encode("latin-1")
+        if size is None:
+            size = os.fstat(fileobj.fileno()).st_size - fileobj.tell()
+        self.content_type = f"multipart/form-data; boundary={boundary}"
+        self._length = len(head) + size + len(tail)
+        self._readers = [io.BytesIO(head), fileobj, io.BytesIO(tail)]
+
+    def __len__(self):
+        return self._length
+
+    def read(self, size=-1):
+        out = bytearray()
+        while self._readers and (size is None or size < 0 or len(out) < size):
+            chunk = self._readers[0].read(-1 if size is None or size < 0 else size - len(out))
+            if chunk:
+                out += chunk
+            else:
+                self._readers.pop(0)
+        return bytes(out)
+
 def parse_invoice_with_llama_cloud(file_path):
     """
     Parse an invoice file using LlamaCloud API
@@ -375,9 +778,12 @@ def parse_invoice_with_llama_cloud(file_path):
         dict: Parsing result with success status and data or error
     """
     try:
-        if not os.path.exists(file_path):
+        # One stat call answers both the existence and the size check
+        try:
+            file_size = os.stat(file_path).st_size
+        except OSError:
             return {'success': False, 'error': f"File not found: {file_path}"}
-        if os.path.getsize(file_path) == 0:
+        if file_size == 0:
             return {'success': False, 'error': "Empty file"}
 
         api_key = os.environ.get('LLAMA_CLOUD_API_ENTOS')
@@ -385,15 +791,11 @@ def parse_invoice_with_llama_cloud(file_path):
             return {'success': False, 'error': "Missing API key"}
 
         file_name = os.path.basename(file_path)
-        file_extension = os.path.splitext(file_name)[1].lower()
+        file_extension = os.path.splitext(file_name)[1][1:].lower()
         base_url = "https://api.cloud.llamaindex.ai"
         upload_url = f"{base_url}/api/parsing/upload"
 
-        mime_type = 'application/pdf'
-        if file_extension in ['.jpg', '.jpeg']:
-            mime_type = 'image/jpeg'
-        elif file_extension == '.png':
-            mime_type = 'image/png'
+        mime_type = _EXTENSION_MIME_TYPES.get(file_extension, 'application/pdf')
 
         headers = {
             "Authorization": f"Bearer {api_key}",
@@ -401,9 +803,14 @@ def parse_invoice_with_llama_cloud(file_path):
         }
 
         logger.debug(f"Uploading invoice file: {file_path}")
+        # Stream the multipart body from disk rather than letting requests buffer it whole
         with open(file_path, "rb") as f:
-            file_data = {'file': (file_name, f.read(), mime_type)}
-            response = requests.post(upload_url, headers=headers, files=file_data, timeout=API_REQUEST_TIMEOUT)
+            def upload():
+                f.seek(0)
+                body = _MultipartFileBody('file', file_name, f, mime_type, file_size)
+                upload_headers = {**headers, "Content-Type": body.content_type}
+                return _session.post(upload_url, headers=upload_headers, data=body, timeout=API_REQUEST_TIMEOUT)
+            response = _send_with_retry(upload, _UPLOAD_RETRY_STATUSES, time.monotonic() + UPLOAD_RETRY_TIMEOUT)
 
         response.raise_for_status()
         job_data = response.json()
@@ -413,30 +820,38 @@ def parse_invoice_with_llama_cloud(file_path):
 
         logger.debug(f"LlamaCloud job created with ID: {job_id}")
         status_url = f"{base_url}/api/parsing/job/{job_id}"
-        start_time = time.time()
+        deadline = time.monotonic() + MAX_POLLING_TIMEOUT
         extraction_data = None
-
-        while time.time() - start_time < MAX_POLLING_TIMEOUT:
-            status_response = requests.get(status_url, headers=headers, timeout=API_REQUEST_TIMEOUT)
+        attempt = 0
+
+        while time.monotonic() < deadline:
+            status_response = _send_with_retry(
+                lambda: _session.get(status_url, headers=headers, timeout=API_REQUEST_TIMEOUT),
+                _RETRY_STATUSES,
+                deadline
+            )
             status_response.raise_for_status()
             status_data = status_response.json()
             job_status = status_data.get("status")
             logger.debug(f"LlamaCloud job status: {job_status}")
 
-            if job_status.lower() in ["complete", "success"]:
+            state = job_status.lower()
+            if state in _DONE_STATES:
                 extraction_data = status_data
                 logger.debug("LlamaCloud processing completed successfully")
                 break
-            if job_status.lower() in ["error", "failed"]:
+            if state in _ERROR_STATES:
                 logger.error(f"LlamaCloud processing failed: {status_data}")
                 return {'success': False, 'error': f"LlamaCloud error: {status_data.get('error', 'Unknown error')}"}
-            time.sleep(2)
+            time.sleep(_poll_delay(attempt))
+            attempt += 1
 
         if not extraction_data:
             logger.error("No extraction data received from LlamaCloud")
             return {'success': False, 'error': "No extraction data received from LlamaCloud"}
 
-        logger.debug(f"LlamaCloud extraction data: {str(extraction_data)[:200]}...")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"LlamaCloud extraction data: {str(extraction_data)[:200]}...")
 
         try:
             transformed_data = transform_llama_cloud_to_invoice_format(extraction_data, file_name)
@@ -451,7 +866,7 @@ def parse_invoice_with_llama_cloud(file_path):
                     
                     # Try to extract vendor name if not already found
                     if not transformed_data.get('vendor_name') or transformed_data.get('vendor_name') == "Unknown Vendor":
-                        match = re.search(r"Contractor Name\s+([A-Za-z\s]+)", text)
+                        match = _CONTRACTOR_NAME_RE.search(text)
                         if match:
                             transformed_data['vendor_name'] = match.group(1).strip()
                             logger.debug(f"Extracted vendor name from text: {transformed_data['vendor_name']}")
@@ -460,7 +875,7 @@ def parse_invoice_with_llama_cloud(file_path):
                     lines = text.splitlines()
                     for line in lines:
                         if "TD CDs" in line and "x" in line:
-                            match = re.search(r"\(?\$?([\d.,]+)\s*x\s*([\d.,]+)", line)
+                            match = _RATE_QTY_RE.search(line)
                             if match:
                                 rate = float(match.group(1).replace(',', ''))
                                 qty = float(match.group(2).replace(',', ''))
@@ -471,7 +886,8 @@ def parse_invoice_with_llama_cloud(file_path):
                                     "amount": round(rate * qty, 2),
                                     "tax": 0.0
                                 }]
-                                logger.debug(f"Extracted line item from text: {transformed_data['line_items']}")
+                                if logger.isEnabledFor(logging.DEBUG):
+                                    logger.debug(f"Extracted line item from text: {transformed_data['line_items']}")
                                 break
             
             invoice_data = normalize_invoice(transformed_data)